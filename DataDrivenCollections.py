@@ -3,6 +3,7 @@ try:
     import time
     import os
     import ntpath
+    import posixpath
     import argparse
     import re
     import sys
@@ -10,6 +11,7 @@ try:
     import glob
     import datetime
     import configparser
+    import json
     from plexapi.server import PlexServer
     from plexapi.myplex import MyPlexAccount
     from plexapi.video import Movie
@@ -19,7 +21,6 @@ try:
     from plexapi.library import MovieSection
     from plexapi.library import ShowSection
     from plexapi.collection import Collection
-    from plexapi.exceptions import NotFound
 except ModuleNotFoundError:
     print('Requirements Error: Please install requirements using "pip install -r requirements.txt"')
     sys.exit(0)
@@ -27,6 +28,30 @@ except ModuleNotFoundError:
 # Plex default supported media containers - used to match media when scanning directories
 VIDEO_MEDIA_CONTAINERS = ["asf", "avi", "mov", "mp4", "mpeg", "mpegts", "mkv", "wmv"]
 
+# Plex's values for collection modes and sort orders, as reported by a collection's 'collectionMode' and 'collectionSort'
+COLLECTION_MODES = {"default": -1, "hide": 0, "hideItems": 1, "showItems": 2}
+COLLECTION_SORTS = {"release": 0, "alpha": 1, "custom": 2}
+
+# records which artwork files previous runs have applied to which Plex items, so new or changed items can be prioritized
+STATE_FILENAME = "DataDrivenCollections.state"
+
+# operation priorities - the scheduler runs lower values first
+PRIORITY_PREPARE = -1       # splitting, merging and planning, which always run before any other operations
+PRIORITY_CHANGED = 0        # new or changed items (artwork not yet applied by a previous run)
+PRIORITY_COLLECTION = 1     # collections whose membership differs from the entry tree
+PRIORITY_VERIFY = 2         # re-verification of unchanged items and collections
+PRIORITY_FINALIZE = 3       # collection priority sort titles, applied after all other operations
+PRIORITY_NAMES = {
+    PRIORITY_PREPARE: "library preparation",
+    PRIORITY_CHANGED: "new or changed items",
+    PRIORITY_COLLECTION: "collection membership updates",
+    PRIORITY_VERIFY: "re-verification of unchanged items",
+    PRIORITY_FINALIZE: "collection priority sort titles",
+}
+
+# the run's time budget is measured from here
+run_start = time.monotonic()
+
 # read args
 parser = argparse.ArgumentParser()
 parser.add_argument("-l", "--library",
@@ -69,6 +94,15 @@ parser.add_argument("--collection-mode", "--collection_mode",
                     dest="collection_mode",
                     help="'default' (library default), 'hide' (hide collections), 'hideItems' (hide Items in collections), 'showItems' (show collections and their items)",
                     default="")
+parser.add_argument("--path-mapping", "--path_mapping",
+                    dest="path_mappings",
+                    help="map a Plex-side path prefix to a local path prefix as 'PLEX_PATH=LOCAL_PATH', so media can be scanned from a different mount or host (can be repeated)",
+                    action="append",
+                    default=[])
+parser.add_argument("--max-duration", "--max_duration",
+                    dest="max_duration",
+                    help="time budget for the run, in seconds (or with an 's', 'm' or 'h' suffix). Remaining operations are deferred to the next run",
+                    default="")
 parser.add_argument("-v", "--verbose",
                     help="verbose logging",
                     action='store_true',
@@ -146,16 +180,57 @@ if has_config and "collection_mode" in config["Config"]:
 if args.collection_mode:
     collection_mode = args.collection_mode
 
+path_mapping_values = []
+if has_config and "path_mappings" in config["Config"]:
+    path_mapping_values = config["Config"]["path_mappings"].splitlines()
+if args.path_mappings:
+    path_mapping_values = args.path_mappings
+
+max_duration = None
+if has_config and "max_duration" in config["Config"]:
+    max_duration = config["Config"]["max_duration"]
+if args.max_duration != "":
+    max_duration = args.max_duration
+
 if not library:
     print("Error: must provide a Plex library name")
     exit(1)
 
+if collection_mode not in COLLECTION_MODES:
+    print(f"Error: invalid collection mode '{collection_mode}' (expected one of: {', '.join(COLLECTION_MODES)})")
+    exit(1)
+
+# parse path mappings into (plex prefix, local prefix) pairs. Longest prefixes are matched first
+path_mappings = []
+for path_mapping in path_mapping_values:
+    if not path_mapping.strip():
+        continue
+    if "=" not in path_mapping:
+        print(f"Error: invalid path mapping '{path_mapping}' (expected 'PLEX_PATH=LOCAL_PATH')")
+        exit(1)
+    plex_prefix, local_prefix = path_mapping.split("=", 1)
+    path_mappings.append((plex_prefix.strip(), local_prefix.strip()))
+path_mappings.sort(key=lambda m : len(m[0]), reverse=True)
+
+# convert the time budget into a deadline, relative to the start of the run
+deadline = None
+if max_duration:
+    duration_match = re.fullmatch(r"\s*(\d+(?:\.\d+)?)\s*([smh]?)\s*", max_duration.lower())
+    if not duration_match:
+        print(f"Error: invalid max duration '{max_duration}' (expected seconds, or a number with an 's', 'm' or 'h' suffix)")
+        exit(1)
+    duration_seconds = float(duration_match.group(1)) * {"": 1, "s": 1, "m": 60, "h": 3600}[duration_match.group(2)]
+    deadline = run_start + duration_seconds
+
 print("============ DataDrivenCollections ============")
 print(f"library:                {library}")
 print(f"artwork filename:       {artwork_filename}")
 print(f"collection priority:    {collection_priority}")
 print(f"collection grouping:    {collection_grouping}")
 print(f"collection mode:        {collection_mode}")
+print(f"max duration:           {max_duration or 'none'}")
+for plex_prefix, local_prefix in path_mappings:
+    print(f"path mapping:           {plex_prefix} -> {local_prefix}")
 print("===============================================")
 
 # connect to Plex
@@ -177,6 +252,22 @@ else:
     print("Error: please provide a form of Plex server authentication (username/password, or Plex API token)")
     exit(1)
 
+# load the record of artwork applied by previous runs - maps artwork paths to the rating key of the item they were applied to, and the artwork's mtime
+applied_artwork = {}
+if os.path.exists(STATE_FILENAME):
+    with open(STATE_FILENAME, "r") as state_file:
+        try:
+            state = json.load(state_file)
+        except ValueError:
+            state = None
+    if isinstance(state, dict) and isinstance(state.get("artwork", {}), dict):
+        applied_artwork = state.get("artwork", {})
+    else:
+        print(f"Warning: '{STATE_FILENAME}' is corrupt. All artwork will be treated as new or changed.")
+
+# keys of the sections actually modified during this run - the finalize phase only reloads hubs for these
+changed_sections = set()
+
 
 class Entry:
     
@@ -224,12 +315,71 @@ class Entry:
             sub_entry.print(plex_maps, depth + 1)
 
 
+def detect_plex_path_style(locations):
+    """
+    Returns the path module matching the separator style of the Plex server, detected from its section 'locations'. The Plex server may run on a different OS than this script
+    """
+    for location in locations:
+        if re.match(r"^([A-Za-z]:|\\\\)", location):
+            return ntpath
+    return posixpath
+
+
+def plex_path_components(plex_path):
+    """
+    Splits 'plex_path' into its components, normalized for comparison
+    """
+    normalized = plex_path_style.normcase(plex_path_style.normpath(plex_path))
+    return normalized.rstrip(plex_path_style.sep).split(plex_path_style.sep)
+
+
+def to_local_path(plex_path):
+    """
+    Translates a Plex-side path to the local path it's scanned from, using the first (longest) matching path mapping
+    """
+    path_components = plex_path_components(plex_path)
+    for plex_prefix, local_prefix in path_mappings:
+        prefix_components = plex_path_components(plex_prefix)
+        if path_components[:len(prefix_components)] == prefix_components:
+
+            # re-join the remaining components with the original casing, using local separators
+            remainder = plex_path_style.normpath(plex_path).rstrip(plex_path_style.sep).split(plex_path_style.sep)[len(prefix_components):]
+            return os.path.normpath(os.path.join(local_prefix, *remainder))
+
+    # unmapped paths are used as-is
+    return plex_path
+
+
+def media_directory(plex_location):
+    """
+    Returns the local directory containing the media file at the Plex-side 'plex_location'
+    """
+    basedir, tail = plex_path_style.split(plex_location)
+    if not tail:
+        basedir, tail = plex_path_style.split(basedir)
+    return to_local_path(basedir)
+
+
+def within_roots(path, roots):
+    """
+    Returns True if the local 'path' lies under one of the scanned entry tree 'roots'
+    """
+    for root in roots:
+        root_path = os.path.normcase(os.path.normpath(root.path))
+        try:
+            if os.path.commonpath([os.path.normcase(path), root_path]) == root_path:
+                return True
+        except ValueError:
+            pass    # paths on different drives, or a Plex-side path that isn't a local path at all
+    return False
+
+
 def build_entry_tree(path, depth=0):
     """
-    Recursively construct an entry tree from 'path' with all relevant metadata and sub-entries
+    Recursively construct an entry tree from the local 'path' with all relevant metadata and sub-entries
     """
-    head, tail = ntpath.split(path)
-    entry = Entry(tail or ntpath.basename(head), path, depth)
+    head, tail = os.path.split(path)
+    entry = Entry(tail or os.path.basename(head), path, depth)
     for entry_element in os.listdir(entry.path):
 
         # look for entry artwork
@@ -247,6 +397,159 @@ def build_entry_tree(path, depth=0):
     return entry
 
 
+def deadline_reached():
+    """
+    Returns True once the run's time budget (if any) has been spent
+    """
+    return deadline is not None and time.monotonic() >= deadline
+
+
+def save_state():
+    """
+    Records the artwork applied so far, so the next run can prioritize new or changed artwork
+    """
+    with open(STATE_FILENAME, "w") as state_file:
+        json.dump({"artwork": applied_artwork}, state_file, indent=4)
+
+
+class Operation:
+
+    def __init__(self, priority, description, action):
+        self.priority = priority
+        self.description = description
+        self.action = action
+
+
+def defer_remaining(operations):
+    """
+    Stops the run once its deadline has passed. Returns the remaining 'operations', which are reported as deferred to the next run
+    """
+    print(f"max duration of {max_duration} reached, stopping")
+    return operations
+
+
+def applied_artwork_record(item, artwork):
+    """
+    Returns the state record for 'artwork' applied to the Plex 'item'
+    """
+    return {"rating_key": item.ratingKey, "mtime": os.path.getmtime(artwork)}
+
+
+def artwork_changed(item, artwork):
+    """
+    Returns True if 'artwork' hasn't been applied to 'item' by a previous run, or the file has been modified since it was. A new
+    Plex item (None, or recreated with a new rating key by splitting, merging or re-adding media) always counts as changed
+    """
+    if item is None:
+        return True
+    return applied_artwork.get(artwork) != applied_artwork_record(item, artwork)
+
+
+def artwork_operation(get_item, artwork, label, priority=None):
+    """
+    Builds an operation that uploads 'artwork' as the poster for the item returned by 'get_item'
+    """
+    if priority is None:
+        priority = PRIORITY_CHANGED if artwork_changed(get_item(), artwork) else PRIORITY_VERIFY
+
+    def apply_artwork():
+        item = get_item()
+        item.uploadPoster(url=None, filepath=artwork)
+        applied_artwork[artwork] = applied_artwork_record(item, artwork)
+        print(f"applied artwork '{artwork}' to poster for {label}")
+
+    return Operation(priority, f"apply artwork '{artwork}' to poster for {label}", apply_artwork)
+
+
+def collection_membership_differs(collection, items):
+    """
+    Returns True if 'collection' doesn't exist yet (None), or any of 'items' aren't in it yet
+    """
+    if collection is None:
+        return True
+    collection_keys = set(item.ratingKey for item in collection.items())
+    return any(item.ratingKey not in collection_keys for item in items)
+
+
+def collection_operations(section, collections, entry, items_for_collection, collection_groups, media_label, ungrouped_sort):
+    """
+    Builds the operations that create/update the collection for 'entry' and apply its artwork. 'collections' maps the section's collection titles to collections, and is updated as collections are created
+    """
+    collection_exists = entry.name in collections
+    membership_differs = collection_membership_differs(collections.get(entry.name), items_for_collection)
+    update_priority = PRIORITY_COLLECTION if membership_differs else PRIORITY_VERIFY
+
+    def update_collection():
+
+        # add all mapped items to collection
+        print(f"creating collection '{entry.name}'")
+        collection = collections.get(entry.name)
+        if collection:
+            if membership_differs:
+                collection.addItems(items_for_collection)
+        else:
+            collection = section.createCollection(entry.name, items_for_collection)
+            collections[entry.name] = collection
+
+        # collection grouping takes grouped sub entries and manipulates their sort order to organize them together in the collection
+        if collection_grouping:
+            for collection_sort_index, group in enumerate(collection_groups):
+                print(f"grouping {str(len(group))} {media_label} together within collection {entry.name}")
+
+                # within the grouping, sort by release year
+                group.sort(key=lambda e : e.year)
+                for collection_group_sort_index, item in enumerate(group):
+                    print(f"    * {item.title}")
+                    sort_title = f"_{str(collection_sort_index)}{str(collection_group_sort_index)}{item.title}"
+                    if item.titleSort != sort_title:
+                        item.editSortTitle(sort_title)
+                        changed_sections.add(section.key)
+
+            # collection grouping relies on alpha sort order to sort properly
+            collection_sort = "alpha" if len(collection_groups) > 0 else ungrouped_sort
+            if int(collection.collectionSort) != COLLECTION_SORTS[collection_sort]:
+                collection.sortUpdate(collection_sort)
+                changed_sections.add(section.key)
+
+        # apply collection mode, unless the collection already has it
+        if int(collection.collectionMode) != COLLECTION_MODES[collection_mode]:
+            print(f"applying collection mode '{collection_mode}' to collection '{entry.name}'", flush=True)
+            collection.modeUpdate("default")
+            time.sleep(0.2)   # without this Plex can get in a bad state trying to update entries. Slow request rate to let it catch up
+            collection.modeUpdate(collection_mode)
+            changed_sections.add(section.key)
+
+    operations = [Operation(update_priority, f"update collection '{entry.name}'", update_collection)]
+
+    # add collection artwork if provided. A collection that doesn't exist yet can't receive artwork until it's been created
+    if entry.artwork:
+        artwork_priority = PRIORITY_CHANGED if artwork_changed(collections.get(entry.name), entry.artwork) else PRIORITY_VERIFY
+        if not collection_exists:
+            artwork_priority = max(artwork_priority, update_priority)
+        operations.append(artwork_operation(lambda: collections[entry.name], entry.artwork, f"collection '{entry.name}'", artwork_priority))
+
+    return operations
+
+
+def run_operations(section, operations):
+    """
+    Runs 'operations' in priority order, stopping at an operation boundary once the run's deadline has passed. Returns the deferred operations
+    """
+    print("========== applying artwork and building collections ==========")
+    operations = sorted(operations, key=lambda o : o.priority)     # stable, so operations keep their planned order within a priority
+    for i, operation in enumerate(operations):
+        if deadline_reached():
+            return defer_remaining(operations[i:])
+        if args.verbose:
+            print(f"[{PRIORITY_NAMES[operation.priority]}] {operation.description}")
+        operation.action()
+
+        # anything other than re-verification of unchanged items modifies the section
+        if operation.priority != PRIORITY_VERIFY:
+            changed_sections.add(section.key)
+    return []
+
+
 def update_plex_movie_library(server, section, roots):
     """
     Updates all collections and posters for the specified movie library section
@@ -255,21 +558,28 @@ def update_plex_movie_library(server, section, roots):
     # maps media disk paths to Plex movies
     plex_media_dir_to_movie = {}
 
+    # splitting, mapping and merging can't be interrupted without leaving split duplicates behind, so the deadline is only checked before starting
+    if deadline_reached():
+        return defer_remaining([Operation(PRIORITY_PREPARE, "split, map and merge movie entries, then plan artwork and collection updates", None)])
+
+    # only media under the scanned roots is split, merged or mapped
+    def movie_within_roots(movie):
+        return all(within_roots(media_directory(location), roots) for location in movie.locations)
+
     # first, split all media Plex has auto-merged. We'll re-merge directory-adjacent media later, but doing the split upfront greatly simplifies things
     print(f"========== splitting all Plex auto-merged media in '{section.title}' ==========")
-    for movie in section.all():
+    for movie in [movie for movie in section.all() if movie_within_roots(movie)]:
         if len(movie.locations) > 1:
             print(f"splitting merged movie entry '{movie.title}' into {str(len(movie.locations))} independent movie entries:")
             for location in movie.locations:
                 print(f"    * {location}")
             movie.split()
+            changed_sections.add(section.key)
 
     # map media directories to their Plex movie entry(s) - at this stage, there may be multiple movie entries with their media files in the same directory
     for movie in section.all():
-        if len(movie.locations) > 0:
-            basedir, tail = ntpath.split(movie.locations[0])
-            if not tail:
-                basedir, tail = ntpath.split(basedir)
+        if len(movie.locations) > 0 and movie_within_roots(movie):
+            basedir = media_directory(movie.locations[0])
             if basedir not in plex_media_dir_to_movie:
                 plex_media_dir_to_movie[basedir] = []
             plex_media_dir_to_movie[basedir].append(movie)
@@ -286,23 +596,29 @@ def update_plex_movie_library(server, section, roots):
                 ratingkeys_to_merge.append(str(plex_media_dir_to_movie[basedir][i].ratingKey))
             print(f"Found {str(len(plex_media_dir_to_movie[basedir]))} media files under base directory {basedir}. Merging into a single movie entry")
             base_movie.merge(ratingkeys_to_merge)
+            changed_sections.add(section.key)
         
         # flatten mapping, merging all other media files into the first and creating a single movie entry
         base_movie = plex_media_dir_to_movie[basedir][0]
         plex_media_dir_to_movie[basedir] = base_movie
 
 
-    # iterate our entry trees and build collections + assign metadata
-    print("========== applying artwork and building collections ==========")
+    # plan artwork and collection operations from our entry trees. These are run in priority order once planning is complete
+    print("========== planning artwork and collection operations ==========")
+    collections = {collection.title: collection for collection in section.collections()}
+    top_level_entries = [entry for root in roots for entry in root.sub_entries]
+    operations = []
     for root in roots:
         for entry in root.sub_entries:
+            if deadline_reached():
+                remaining = top_level_entries[top_level_entries.index(entry):]
+                return defer_remaining([Operation(PRIORITY_PREPARE, f"plan updates for '{e.name}'", None) for e in remaining] + operations)
 
             # if this entry is mapped, apply artwork
             if entry.path in plex_media_dir_to_movie:
                 if entry.artwork:
                     movie = plex_media_dir_to_movie[entry.path]
-                    movie.uploadPoster(url=None, filepath=entry.artwork)
-                    print(f"applied artwork '{entry.artwork}' to poster for movie '{movie.title}'")
+                    operations.append(artwork_operation(lambda movie=movie : movie, entry.artwork, f"movie '{movie.title}'"))
 
             # evaluate the sub-entries of this entry, if any
             if len(entry.sub_entries) > 0:
@@ -319,60 +635,26 @@ def update_plex_movie_library(server, section, roots):
 
                 # if a top-level entry has any mapped sub-entries (at any depth), build a collection
                 if len(mapped_entries) > 0:
-
-                    # add all mapped items to collection
-                    print(f"creating collection '{entry.name}'")
                     items_for_collection = [plex_media_dir_to_movie[i.path] for i in mapped_entries]
-                    collection = None
-                    try:
-                        collection = section.collection(entry.name)
-                        collection.addItems(items_for_collection)
-                    except NotFound:
-                        collection = section.createCollection(entry.name, items_for_collection)
-
-                    # add artwork to all sub-entries in collection
-                    for sub_entry in mapped_entries:
-                        if sub_entry.artwork:
-                            movie = plex_media_dir_to_movie[sub_entry.path]
-                            movie.uploadPoster(url=None, filepath=sub_entry.artwork)
-                            print(f"applied artwork '{sub_entry.artwork}' to poster for movie '{movie.title}'")
 
-                    # add collection artwork if provided
-                    if entry.artwork:
-                        collection.uploadPoster(url=None, filepath=entry.artwork)
-                        print(f"applied artwork '{entry.artwork}' to poster for collection '{collection.title}'")
-                    
-                    # collection grouping takes grouped sub entries and manipulates their sort order to organize them together in the collection
+                    # sub-directories within the collection form sort groups of their mapped movies
+                    collection_groups = []
                     if collection_grouping:
-                        collection_sort_index = 0
-                        has_collection_groups = False
                         for sub_entry in entry.sub_entries:
                             if sub_entry not in plex_media_dir_to_movie:
                                 mapped_sub_entries = [plex_media_dir_to_movie[i.path] for i in find_mapped_entries_recursive(sub_entry)]
                                 if len(mapped_sub_entries) > 0:
-                                    has_collection_groups = True
-                                    print(f"grouping {str(len(mapped_sub_entries))} movies together within collection {entry.name}")
-
-                                    # within the grouping, sort by movie release year
-                                    collection_group_sort_index = 0
-                                    mapped_sub_entries.sort(key=lambda e : e.year)
-                                    for movie in mapped_sub_entries:
-                                        print(f"    * {movie.title}")
-                                        movie.editSortTitle(f"_{str(collection_sort_index)}{str(collection_group_sort_index)}{movie.title}")
-                                        collection_group_sort_index += 1
-                                    collection_sort_index += 1
-                        
-                        # collection grouping relies on alpha sort order to sort properly
-                        if has_collection_groups:
-                            collection.sortUpdate("alpha")
-                        else:
-                            collection.sortUpdate("release")
+                                    collection_groups.append(mapped_sub_entries)
+
+                    operations += collection_operations(section, collections, entry, items_for_collection, collection_groups, "movies", "release")
+
+                    # add artwork to all sub-entries in collection
+                    for sub_entry in mapped_entries:
+                        if sub_entry.artwork:
+                            movie = plex_media_dir_to_movie[sub_entry.path]
+                            operations.append(artwork_operation(lambda movie=movie : movie, sub_entry.artwork, f"movie '{movie.title}'"))
 
-                    # apply collection mode
-                    print(f"applying collection mode '{collection_mode}' to collection '{entry.name}'", flush=True)
-                    collection.modeUpdate("default")
-                    time.sleep(0.2)   # without this Plex can get in a bad state trying to update entries. Slow request rate to let it catch up
-                    collection.modeUpdate(collection_mode)
+    deferred = run_operations(section, operations)
 
     # dump tree state if logging is set to verbose
     if args.verbose:
@@ -380,6 +662,8 @@ def update_plex_movie_library(server, section, roots):
             print(f"==========|{root.path}|==========")
             root.print([plex_media_dir_to_movie])
 
+    return deferred
+
 
 def update_plex_show_library(server, section, roots):
     """
@@ -392,9 +676,17 @@ def update_plex_show_library(server, section, roots):
     # map media disk paths to Plex show seasons
     plex_media_dir_to_season = {}
 
+    # splitting, mapping and merging can't be interrupted without leaving split duplicates behind, so the deadline is only checked before starting
+    if deadline_reached():
+        return defer_remaining([Operation(PRIORITY_PREPARE, "split, map and merge show entries, then plan artwork and collection updates", None)])
+
+    # only media under the scanned roots is split, merged or mapped
+    def show_within_roots(show):
+        return all(within_roots(to_local_path(location), roots) for location in show.locations)
+
     # first, split all media Plex has auto-merged. We'll re-merge directory-adjacent media later, but doing the split upfront greatly simplifies things
     print(f"========== splitting all Plex auto-merged media in '{section.title}' ==========")
-    for show in section.all():
+    for show in [show for show in section.all() if show_within_roots(show)]:
 
         # any episode with multiple media locations implies a show with merged media
         def contains_merged_content(show):
@@ -408,6 +700,7 @@ def update_plex_show_library(server, section, roots):
         if contains_merged_content(show):
             print(f"splitting merged show entry '{show.title}' into independent show entries")
             show.split()
+            changed_sections.add(section.key)
 
     # container for tracking all the different unique media directories for each season's episodes. We need this data to check against show/season directory ambiguity
     class Show:
@@ -416,7 +709,7 @@ def update_plex_show_library(server, section, roots):
             self.unique_season_media_locations = {}     # maps the show's season number to a list of the unique media directories referenced by the season's episodes
 
     # scan for media and attempt to correlate it to show / season base directories
-    for show in section.all():
+    for show in [show for show in section.all() if show_within_roots(show)]:
         s = Show(show)
         for season in show.seasons():
 
@@ -424,9 +717,7 @@ def update_plex_show_library(server, section, roots):
             s.unique_season_media_locations[season.seasonNumber] = []
             for episode in season.episodes():
                 for location in episode.locations:
-                    basedir, tail = ntpath.split(location)
-                    if not tail:
-                        basedir, tail = ntpath.split(basedir)
+                    basedir = media_directory(location)
                     if basedir not in s.unique_season_media_locations[season.seasonNumber]:
                         s.unique_season_media_locations[season.seasonNumber].append(basedir)
             
@@ -456,9 +747,9 @@ def update_plex_show_library(server, section, roots):
         show_roots = []
         for season in show.seasons():
             for location in s.unique_season_media_locations[season.seasonNumber]:
-                basedir, tail = ntpath.split(location)
+                basedir, tail = os.path.split(location)
                 if not tail:
-                    basedir, tail = ntpath.split(basedir)
+                    basedir, tail = os.path.split(basedir)
                 if basedir not in show_roots:
                     show_roots.append(basedir)
         
@@ -515,6 +806,7 @@ def update_plex_show_library(server, section, roots):
                     s = ambiguous_shows[i]
                     ratingkeys_to_merge.append(s.show.seasons()[0].parentRatingKey)     # not sure why the PlexAPI has parentRatingKeys on seasons, but no exposed ratingKey on the show itself?? 
                 ambiguous_shows[0].show.merge()
+                changed_sections.add(section.key)
             
             else:
                 # if we aren't merging these shows, they're ambiguous - remove from mapping
@@ -541,10 +833,16 @@ def update_plex_show_library(server, section, roots):
             base_season = plex_media_dir_to_season[media_dir][0]
             plex_media_dir_to_season[media_dir] = base_season
 
-    # iterate our entry trees and build collections + assign metadata
-    print("========== applying artwork and building collections ==========")
+    # plan artwork and collection operations from our entry trees. These are run in priority order once planning is complete
+    print("========== planning artwork and collection operations ==========")
+    collections = {collection.title: collection for collection in section.collections()}
+    top_level_entries = [entry for root in roots for entry in root.sub_entries]
+    operations = []
     for root in roots:
         for entry in root.sub_entries:
+            if deadline_reached():
+                remaining = top_level_entries[top_level_entries.index(entry):]
+                return defer_remaining([Operation(PRIORITY_PREPARE, f"plan updates for '{e.name}'", None) for e in remaining] + operations)
 
             # if we have sub-entries, we need to check if any are mapped as shows. Mapped show sub-entries mean this should be treated as a collection
             if len(entry.sub_entries) > 0:
@@ -567,60 +865,28 @@ def update_plex_show_library(server, section, roots):
                 # treat this as a collection
                 if len(items_for_collection) > 0:
 
-                    # add all mapped items to collection
-                    print(f"creating collection '{entry.name}'")
-                    collection = None
-                    try:
-                        collection = section.collection(entry.name)
-                        collection.addItems(items_for_collection)
-                    except NotFound:
-                        collection = section.createCollection(entry.name, items_for_collection)
+                    # sub-directories within the collection form sort groups of their mapped shows
+                    collection_groups = []
+                    if collection_grouping:
+                        for sub_entry in entry.sub_entries:
+                            if sub_entry not in plex_media_dir_to_show:
+                                mapped_sub_entries = [plex_media_dir_to_show[i.path] for i in find_mapped_entries_recursive(sub_entry, plex_media_dir_to_show)]
+                                if len(mapped_sub_entries) > 0:
+                                    collection_groups.append(mapped_sub_entries)
+
+                    operations += collection_operations(section, collections, entry, items_for_collection, collection_groups, "shows", "alpha")
 
                     # add artwork to all mapped shows in collection
                     for sub_entry in show_entries:
                         if sub_entry.artwork:
                             show = plex_media_dir_to_show[sub_entry.path]
-                            show.uploadPoster(url=None, filepath=sub_entry.artwork)
-                            print(f"applied artwork '{sub_entry.artwork}' to poster for show '{show.title}'")
+                            operations.append(artwork_operation(lambda show=show : show, sub_entry.artwork, f"show '{show.title}'"))
                     
                     # add artwork to all mapped seasons of all mapped shows in collection
                     for sub_entry in season_entries:
                         if sub_entry.artwork:
                             season = plex_media_dir_to_season[sub_entry.path]
-                            season.uploadPoster(url=None, filepath=sub_entry.artwork)
-                            print(f"applied artwork '{sub_entry.artwork}' to poster for season {season.seasonNumber} of show '{season.parentTitle}'")
-
-                    # add collection artwork if provided
-                    if entry.artwork:
-                        collection.uploadPoster(url=None, filepath=entry.artwork)
-                        print(f"applied artwork '{entry.artwork}' to poster for collection '{collection.title}'")
-
-                    # collection grouping takes grouped sub entries and manipulates their sort order to organize them together in the collection
-                    if collection_grouping:
-                        collection_sort_index = 0
-                        for sub_entry in entry.sub_entries:
-                            if sub_entry not in plex_media_dir_to_show:
-                                mapped_sub_entries = [plex_media_dir_to_show[i.path] for i in find_mapped_entries_recursive(sub_entry, plex_media_dir_to_show)]
-                                if len(mapped_sub_entries) > 0:
-                                    print(f"grouping {str(len(mapped_sub_entries))} shows together within collection {entry.name}")
-
-                                    # within the grouping, sort by movie release year
-                                    collection_group_sort_index = 0
-                                    mapped_sub_entries.sort(key=lambda e : e.year)
-                                    for show in mapped_sub_entries:
-                                        print(f"    * {show.title}")
-                                        show.editSortTitle(f"_{str(collection_sort_index)}{str(collection_group_sort_index)}{show.title}")
-                                        collection_group_sort_index += 1
-                                    collection_sort_index += 1
-                        
-                        # collection grouping relies on alpha sort order to sort properly
-                        collection.sortUpdate("alpha")
-                    
-                    # apply collection mode
-                    print(f"applying collection mode '{collection_mode}' to collection '{entry.name}'", flush=True)
-                    collection.modeUpdate("default")
-                    time.sleep(0.2)   # without this Plex can get in a bad state trying to update entries. Slow request rate to let it catch up
-                    collection.modeUpdate(collection_mode)
+                            operations.append(artwork_operation(lambda season=season : season, sub_entry.artwork, f"season {season.seasonNumber} of show '{season.parentTitle}'"))
                 
                 # if none of the sub-entries are mapped shows, but this directory is mapped, treat this like a show entry
                 elif entry.path in plex_media_dir_to_show:
@@ -628,16 +894,14 @@ def update_plex_show_library(server, section, roots):
                     # show artwork
                     if entry.artwork:
                         show = plex_media_dir_to_show[entry.path]
-                        show.uploadPoster(url=None, filepath=entry.artwork)
-                        print(f"applied artwork '{entry.artwork}' to poster for show '{show.title}'")
+                        operations.append(artwork_operation(lambda show=show : show, entry.artwork, f"show '{show.title}'"))
                 
                     # seasons artwork
                     for sub_entry in entry.sub_entries:
                         if sub_entry.artwork:
                             if sub_entry.path in plex_media_dir_to_season:
                                 season = plex_media_dir_to_season[sub_entry.path]
-                                season.uploadPoster(url=None, filepath=sub_entry.artwork)
-                                print(f"applied artwork '{sub_entry.artwork}' to poster for show '{season.title}'")
+                                operations.append(artwork_operation(lambda season=season : season, sub_entry.artwork, f"show '{season.title}'"))
 
             # process show entry
             else:
@@ -646,16 +910,16 @@ def update_plex_show_library(server, section, roots):
                 if entry.artwork:
                     if entry.path in plex_media_dir_to_show:
                         show = plex_media_dir_to_show[entry.path]
-                        show.uploadPoster(url=None, filepath=entry.artwork)
-                        print(f"applied artwork '{entry.artwork}' to poster for show '{show.title}'")
+                        operations.append(artwork_operation(lambda show=show : show, entry.artwork, f"show '{show.title}'"))
                 
                 # seasons artwork
                 for sub_entry in entry.sub_entries:
                     if sub_entry.artwork:
                         if sub_entry.path in plex_media_dir_to_season:
                             season = plex_media_dir_to_season[sub_entry.path]
-                            season.uploadPoster(url=None, filepath=sub_entry.artwork)
-                            print(f"applied artwork '{sub_entry.artwork}' to poster for show '{season.title}'")
+                            operations.append(artwork_operation(lambda season=season : season, sub_entry.artwork, f"show '{season.title}'"))
+
+    deferred = run_operations(section, operations)
 
     # dump tree state if logging is set to verbose
     if args.verbose:
@@ -663,32 +927,71 @@ def update_plex_show_library(server, section, roots):
             print(f"==========|{root.path}|==========")
             root.print([plex_media_dir_to_show, plex_media_dir_to_season])
 
+    return deferred
+
 # connect to plex and gather lib info
 section = server.library.section(library)
 
+# Plex-side paths are split and matched using the Plex server's path style, regardless of the OS this script runs on
+plex_path_style = detect_plex_path_style(section.locations)
+
 # construct an entry tree for each physical disk location that makes up the section
 roots = []
 for location in section.locations:
-    print(f"building entry tree for section '{library}' location '{location}'...")
-    roots.append(build_entry_tree(location))
+    local_location = to_local_path(location)
+    if not os.path.isdir(local_location):
+        print(f"Warning: section location '{location}' isn't accessible locally as '{local_location}' (check path mappings). Skipping.")
+        continue
+    print(f"building entry tree for section '{library}' location '{location}' from '{local_location}'...")
+    roots.append(build_entry_tree(local_location))
+
+if len(roots) == 0:
+    print(f"Error: none of the locations for section '{library}' are accessible locally (check path mappings)")
+    exit(1)
 
 # update plex with metadata based on the entry trees constructed above
-if section.type == "movie":
-    update_plex_movie_library(server, section, roots)
-elif section.type == "show":
-    update_plex_show_library(server, section, roots)
-else:
-    print(f"Error: attempted to update an unsupported section type '{section.type}'")
-
-# update collection sort order, if specified
-if args.collection_priority:
+# applied artwork is recorded even if the run fails partway through, so the next run doesn't re-prioritize it
+deferred = []
+try:
+    if section.type == "movie":
+        deferred = update_plex_movie_library(server, section, roots)
+    elif section.type == "show":
+        deferred = update_plex_show_library(server, section, roots)
+    else:
+        print(f"Error: attempted to update an unsupported section type '{section.type}'")
+finally:
+    save_state()
+
+# update collection sort order, if specified. Only collections without the prioritized sort title (new or renamed) need it edited
+if collection_priority:
     print("updating sort titles to prioritize collections")
     for collection in section.collections():
-        collection.editSortTitle(f"_{collection.title}")
+        if collection.titleSort != f"_{collection.title}":
+            if deadline_reached():
+                deferred.append(Operation(PRIORITY_FINALIZE, f"prioritize sort title for collection '{collection.title}'", None))
+                continue
+            collection.editSortTitle(f"_{collection.title}")
+            changed_sections.add(section.key)
+
+# reload hubs only for sections changed during this run. This isn't budgeted, so changes made before the deadline show up in Plex right away
+if len(changed_sections) > 0:
+    print(f"reloading hubs for {str(len(changed_sections))} changed section(s)")
+    for section_key in changed_sections:
+        for hub in server.library.hubs(sectionID=section_key):
+            hub.reload()
+else:
+    print("no changes made, skipping hub reload")
+
+# report any operations that didn't fit in the time budget. These will be picked up again by the next run
+if len(deferred) > 0:
+    print(f"========== deferred {str(len(deferred))} operation(s) to the next run ==========")
+    for priority in sorted(PRIORITY_NAMES):
+        deferred_operations = [o for o in deferred if o.priority == priority]
+        if len(deferred_operations) > 0:
+            print(f"{PRIORITY_NAMES[priority]} ({str(len(deferred_operations))}):")
+            for operation in deferred_operations:
+                print(f"    * {operation.description}")
 
-for hub in server.library.hubs():
-    hub.reload()
-        
 print("Done.")
 
 